@@ -2,7 +2,7 @@
 """
 Domain Redirect Mapper
 
-Reads a CSV of domains/subdomains, loads each URL sequentially in a real browser
+Reads a CSV of domains/subdomains, loads each URL in a real browser
 (Playwright/Chromium) so server and JavaScript redirects are followed, then
 exports a CSV showing, for each source URL, the final destination URL, how many
 input domains point to that destination domain, and whether the destination is
@@ -13,7 +13,8 @@ Output columns:
 - destination_url
 - pointing_to_count  (how many *input* domains point to this destination domain)
 - points_to_list_domain (True/False)
- - dom_size_chars (character length of the page's HTML at settle time)
+ - dom_size_chars (character length of the page's HTML at settle time; empty
+   for rows resolved by the --http-first fast path, where nothing is rendered)
 
 By default, counting is done at the *registrable domain* level (e.g.,
 sub.example.co.uk -> example.co.uk). You can change this to count by full host
@@ -32,46 +33,187 @@ Setup (first time):
   playwright install chromium
 
 Notes:
-  - The script is sequential by design (per your requirement).
-  - It tries HTTPS first, then falls back to HTTP if needed.
+  - The script is sequential by default; pass --concurrency N to resolve up to
+    N URLs at once in separate tabs of the same browser context. Tabs are
+    reused between URLs rather than opened per URL.
+  - It tries HTTPS first, then falls back to HTTP if the HTTPS attempt fails
+    with a TLS or connection-refused error (not on timeouts). Inputs that
+    already carry a scheme are used as-is.
+  - With --http-first (requires aiohttp), each URL is first resolved with plain
+    HTTP requests and the browser is only used when that can't settle it: an
+    error, a Refresh header, or any HTML page while JavaScript is enabled
+    (with --js-settle 0, only HTML containing a meta refresh). The fast path
+    gives up after 3 seconds and leaves slow hosts to the browser. It pays off
+    for lists dominated by plain 30x redirects or non-HTML targets.
   - Timeouts can be tuned via CLI flags.
+  - To avoid a Chromium cold start per run, start a shared browser once with
+    --launch-cdp and point later runs at it with --cdp-endpoint <ws-url>.
+    Each run still gets its own fresh browser context.
 """
 
 import argparse
 import asyncio
 import csv
+import errno
+import functools
 import sys
 import time
-import io
-from dataclasses import dataclass, asdict
+import itertools
+import json
+import re
+import tempfile
+import urllib.request
+from collections import Counter
+from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple
-from urllib.parse import urlparse
+from typing import Callable, Dict, Iterator, List, Optional, Set, Tuple
+from urllib.parse import urlparse, urlsplit, urlunsplit
+
+def _idna_variants(rule: str) -> Tuple[str, ...]:
+    """Return the rule plus its punycode form, since hosts from URLs arrive as ASCII."""
+    if rule.isascii():
+        return (rule,)
+    try:
+        return (rule, rule.encode("idna").decode("ascii"))
+    except UnicodeError:
+        return (rule,)
+
+
+def build_suffix_sets(rules) -> Tuple[frozenset, frozenset, frozenset]:
+    """Split public suffix rules into (plain, wildcard parents, exceptions) sets."""
+    plain, wildcard, exception = set(), set(), set()
+    for rule in rules:
+        rule = rule.strip().lower()
+        if rule.startswith("!"):
+            exception.update(_idna_variants(rule[1:]))
+        elif rule.startswith("*."):
+            wildcard.update(_idna_variants(rule[2:]))
+        elif rule:
+            plain.update(_idna_variants(rule))
+    return frozenset(plain), frozenset(wildcard), frozenset(exception)
+
+
+def registrable_from_suffixes(hostname: str, plain: frozenset, wildcard: frozenset, exception: frozenset) -> str:
+    """Return the registrable domain (suffix + one label), or '' if no suffix matches.
+
+    Probes from the longest candidate down, so the first hit is the longest
+    matching public suffix rule.
+    """
+    labels = hostname.split(".")
+    n = len(labels)
+    for i in range(n):
+        candidate = ".".join(labels[i:])
+        if candidate in exception:
+            suffix_len = n - i - 1
+        elif candidate in plain or (i + 1 < n and ".".join(labels[i + 1:]) in wildcard):
+            suffix_len = n - i
+        else:
+            continue
+        if suffix_len >= n:
+            return ""
+        return ".".join(labels[n - suffix_len - 1:])
+    return ""
+
 
 # Optional dependency handling for registrable domain extraction
 try:
     import tldextract  # type: ignore
+    # tldextract only supplies its bundled suffix snapshot (no live fetch, no
+    # disk cache); lookups run against plain frozensets built once at import.
+    _TLD = tldextract.TLDExtract(suffix_list_urls=(), cache_dir=None)
+    _SUFFIX_RULES = _TLD.tlds() if callable(_TLD.tlds) else _TLD.tlds
+    _PLAIN_SUFFIXES, _WILDCARD_SUFFIXES, _EXCEPTION_SUFFIXES = build_suffix_sets(_SUFFIX_RULES)
+
+    @functools.lru_cache(maxsize=None)
     def registrable_domain(hostname: str) -> str:
         if not hostname:
             return ""
-        ext = tldextract.extract(hostname)
-        if not ext.registered_domain:
+        host = hostname.lower().rstrip(".")
+        reg = registrable_from_suffixes(host, _PLAIN_SUFFIXES, _WILDCARD_SUFFIXES, _EXCEPTION_SUFFIXES)
+        if not reg:
             # e.g., localhost or an IP address
             return hostname.lower()
-        return ext.registered_domain.lower()
+        return reg
 except Exception:
     # Fallback: use netloc as-is (less accurate for multi-level TLDs)
     def registrable_domain(hostname: str) -> str:
         return (hostname or "").lower()
 
+# Optional dependency for the --http-first plain-HTTP fast path
+try:
+    import aiohttp  # type: ignore
+except Exception:
+    aiohttp = None
+
+# Optional C-accelerated URL parsing for hostname extraction (ships with aiohttp)
+try:
+    from yarl import URL  # type: ignore
+except Exception:
+    URL = None
+
+# With JavaScript disabled only a meta refresh can still move an HTML page
+META_REFRESH_RE = re.compile(r"http-equiv\s*=\s*[\"']?refresh", re.IGNORECASE)
+HTML_CONTENT_TYPES = ("text/html", "application/xhtml+xml")
+# Upper bound for one plain-HTTP attempt (redirect chain and any body read);
+# slower hosts are left to the browser, so they cost at most this much extra.
+HTTP_FAST_PATH_TIMEOUT_MS = 3000
+# Poll window for meta refresh when JavaScript is disabled (--js-settle 0)
+META_REFRESH_SETTLE_MS = 500
+
+
+# Resource types and tracker hosts that never affect where a page ends up
+BLOCKED_RESOURCE_TYPES = frozenset({"image", "font", "media", "stylesheet"})
+BLOCKED_HOST_SUFFIXES = (
+    "doubleclick.net",
+    "google-analytics.com",
+    "googletagmanager.com",
+    "facebook.net",
+    "hotjar.com",
+)
+
+
+# Write buffer for the spool and output CSVs; large outputs need far fewer write() calls
+CSV_BUFFER_BYTES = 1024 * 1024
+
+OUTPUT_FIELDS = ["source_url", "destination_url", "pointing_to_count", "points_to_list_domain", "dom_size_chars"]
+
 
 @dataclass
-class Row:
-    source_url: str
-    destination_url: str
-    pointing_to_count: int
-    points_to_list_domain: bool
-    dom_size_chars: int
+class CountTally:
+    """Running destination counts and input registrable domains for one run.
+
+    count_by: 'registrable' or 'host'
+    """
+    count_by: str
+    inbound: Counter = field(default_factory=Counter)
+    input_regs: Set[str] = field(default_factory=set)
+    # Chosen once from count_by: (dest_host, dest_reg) -> count key
+    key_fn: Callable[[str, str], str] = field(init=False, repr=False)
+
+    def __post_init__(self) -> None:
+        if self.count_by == "registrable":
+            self.key_fn = lambda host, reg: reg
+        elif self.count_by == "host":
+            self.key_fn = lambda host, reg: host
+        else:
+            raise ValueError(f"count_by must be 'registrable' or 'host', got {self.count_by!r}")
+
+    def add(self, raw: str, dest: str) -> Tuple[str, str]:
+        """Record one source/destination pair.
+
+        Returns (count key, destination registrable domain) so callers can
+        spool them instead of re-parsing the destination later.
+        """
+        host = host_from_raw(raw)
+        if host:
+            self.input_regs.add(registrable_domain(host))
+
+        dest_host = hostname_from_url(dest).lower() if dest else ""
+        dest_reg = registrable_domain(dest_host) if dest_host else ""
+        key = self.key_fn(dest_host, dest_reg)
+        if key:
+            self.inbound[key] += 1
+        return key, dest_reg
 
 
 def format_hhmmss(total_seconds: float) -> str:
@@ -84,14 +226,21 @@ def format_hhmmss(total_seconds: float) -> str:
     return f"{hours:02d}:{minutes:02d}:{secs:02d}"
 
 
-def build_progress_bar(completed: int, total: int, width: int = 30) -> str:
+# Bar fill strings built once and sliced per call
+BAR_WIDTH = 30
+BAR_EQ = "=" * BAR_WIDTH
+BAR_DOT = "." * BAR_WIDTH
+
+
+def build_progress_bar(completed: int, total: int, width: int = BAR_WIDTH) -> str:
+    eq, dot = (BAR_EQ, BAR_DOT) if width <= BAR_WIDTH else ("=" * width, "." * width)
     if total <= 0:
-        return "[{}]".format("." * width)
+        return "[" + dot[:width] + "]"
     if completed >= total:
-        return "[{}]".format("=" * width)
+        return "[" + eq[:width] + "]"
     filled = int(width * (completed / total))
     filled = min(filled, width - 1)
-    return "[{}>{}]".format("=" * filled, "." * (width - filled - 1))
+    return "[" + eq[:filled] + ">" + dot[:width - filled - 1] + "]"
 
 
 def truncate_label(label: str, max_len: int = 40) -> str:
@@ -120,46 +269,197 @@ def render_progress_line(completed: int, total: int, elapsed_s: float, current_l
     )
 
 
-def ensure_url_scheme(raw: str) -> Tuple[str, str]:
-    """Return a tuple of (https_url, http_url) for a raw domain/URL string.
-    If a scheme is present, https_url == http_url == raw.
+class ProgressReporter:
+    """Batch per-URL result lines and progress redraws into few writes.
+
+    On a TTY the progress line is redrawn at most every min_interval_s; on
+    other streams result lines are flushed, with one progress line, every
+    batch_size URLs. Either way pending lines are never held for longer than
+    that interval (max_delay_s off a TTY): a timer on the running event loop
+    flushes them even if no further result arrives. Progress text is only
+    rendered when it is about to be written.
+    """
+
+    def __init__(
+        self,
+        total: int,
+        out=None,
+        min_interval_s: float = 0.1,
+        batch_size: int = 100,
+        max_delay_s: float = 2.0,
+    ):
+        self.total = total
+        self.out = out if out is not None else sys.stdout
+        self.is_tty = self.out.isatty()
+        self.min_interval_s = min_interval_s
+        self.batch_size = batch_size
+        self.max_delay_s = max_delay_s
+        self.start = time.monotonic()
+        self.last_emit = self.start
+        self.completed = 0
+        self.label = ""
+        self.lines: List[str] = []
+        self.progress_len = 0
+        self.timer: Optional[asyncio.TimerHandle] = None
+
+    def result(self, raw: str, final_url: str) -> None:
+        self.completed += 1
+        self.label = raw
+        # Per-domain result line with full final URL (scheme included)
+        self.lines.append(f"[{self.completed}/{self.total}] input: {raw} -> final: {final_url}")
+        delay = self.min_interval_s if self.is_tty else self.max_delay_s
+        wait = delay - (time.monotonic() - self.last_emit)
+        if wait <= 0 or (not self.is_tty and len(self.lines) >= self.batch_size):
+            self.emit()
+        elif self.timer is None:
+            try:
+                self.timer = asyncio.get_running_loop().call_later(wait, self.flush)
+            except RuntimeError:
+                pass  # no event loop; lines go out with the next emit
+
+    def emit(self, label: Optional[str] = None, final: bool = False) -> None:
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        now = time.monotonic()
+        self.last_emit = now
+        line = render_progress_line(self.completed, self.total, now - self.start, self.label if label is None else label)
+        if self.is_tty:
+            # Wipe the previous progress line, print results, then redraw progress
+            chunk = "\r" + (" " * max(self.progress_len, 80)) + "\r"
+            chunk += "".join(ln + "\n" for ln in self.lines)
+            chunk += line + ("\n" if final else "")
+            self.progress_len = len(line)
+        else:
+            # Non-TTY: clean lines only, no stray carriage returns
+            chunk = "".join(ln + "\n" for ln in self.lines) + line + "\n"
+        self.lines.clear()
+        self.out.write(chunk)
+        self.out.flush()
+
+    def flush(self, final: bool = False) -> None:
+        """Write any pending result lines now.
+
+        final also ends the TTY progress line, e.g. before exiting on an
+        interrupt, so later output starts on a fresh line.
+        """
+        if self.lines or (final and self.is_tty):
+            self.emit(final=final)
+        elif self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+
+    def finish(self) -> None:
+        """Flush pending results and draw the final 100% line."""
+        if self.is_tty:
+            self.emit(label="done", final=True)
+        else:
+            self.flush()
+
+
+# Browser errors where the HTTPS attempt failed fast and plain HTTP may still work.
+# Timeouts are deliberately absent: retrying would spend another full timeout.
+HTTP_FALLBACK_ERRORS = ("net::ERR_SSL_", "net::ERR_CERT_", "net::ERR_CONNECTION_REFUSED")
+
+
+def ensure_url_scheme(raw: str) -> Tuple[str, Optional[str]]:
+    """Return (primary_url, http_fallback_url) for a raw domain/URL string.
+
+    Bare domains get https:// with an http:// fallback. If a scheme is present
+    (or raw is empty) the URL is used as-is and the fallback is None.
     """
     raw = raw.strip()
     if not raw:
-        return raw, raw
+        return raw, None
     parsed = urlparse(raw)
     if parsed.scheme:
-        return raw, raw
+        return raw, None
     # treat input as hostname/path-like domain
     return f"https://{raw}", f"http://{raw}"
 
 
+async def block_unneeded_resources(route) -> None:
+    """Route handler that aborts assets and analytics irrelevant to redirect resolution.
+
+    Navigations are never blocked: inputs and redirect hops through ad or
+    tracker hosts (click trackers) must still be followed.
+    """
+    request = route.request
+    if request.is_navigation_request():
+        await route.continue_()
+        return
+    if request.resource_type in BLOCKED_RESOURCE_TYPES:
+        await route.abort()
+        return
+    host = (urlparse(request.url).hostname or "").lower()
+    if any(host == h or host.endswith("." + h) for h in BLOCKED_HOST_SUFFIXES):
+        await route.abort()
+        return
+    await route.continue_()
+
+
+async def meta_refresh_settle_ms(page, timeout_ms: int) -> int:
+    """Settle window for a page loaded with JavaScript disabled.
+
+    A meta refresh still navigates without JavaScript, but only once the
+    document has fully loaded, so pages carrying one wait for 'load' and get
+    META_REFRESH_SETTLE_MS of polling. Other pages need none.
+    """
+    try:
+        if await page.query_selector('meta[http-equiv="refresh" i]') is None:
+            return 0
+        await page.wait_for_load_state("load", timeout=timeout_ms)
+    except Exception:
+        pass  # e.g. the refresh already navigated away mid-query; poll anyway
+    return META_REFRESH_SETTLE_MS
+
+
 async def resolve_final_url(page, start_url: str, timeout_ms: int, js_settle_ms: int) -> Tuple[str, int]:
     """Navigate to start_url and try to capture the final URL after redirects.
 
-    We wait for 'networkidle', then give a small window for JS redirects
-    (location changes, meta refresh) by polling the URL for js_settle_ms.
+    Navigation only waits for the response to commit; main-frame navigations
+    (HTTP 30x hops and later JS/meta-refresh hops) are recorded via
+    'framenavigated'. We then wait for the DOM to be parsed, without waiting on
+    subresources, and poll for JS redirects for js_settle_ms. With
+    js_settle_ms=0 (JavaScript disabled) only pages carrying a meta refresh get
+    a short poll, see meta_refresh_settle_ms.
     """
-    await page.goto(start_url, timeout=timeout_ms, wait_until="domcontentloaded")
-    # Try to wait for network to settle, but don't block forever
+    last_url = [start_url]
+
+    def on_navigated(frame) -> None:
+        if frame.parent_frame is None:
+            last_url[0] = frame.url
+
+    page.on("framenavigated", on_navigated)
     try:
-        await page.wait_for_load_state("networkidle", timeout=timeout_ms)
-    except Exception:
-        pass  # continue regardless; some sites never reach networkidle
-
-    # Poll for JS-driven URL changes for js_settle_ms
-    final_url = page.url
-    if js_settle_ms > 0:
-        remaining = js_settle_ms
-        step = 250
-        while remaining > 0:
-            await page.wait_for_timeout(min(step, remaining))
-            current = page.url
-            if current != final_url:
-                final_url = current
-                # Reset small window to catch cascading redirects
-                remaining = min(js_settle_ms, remaining + 2 * step)
-            remaining -= step
+        await page.goto(start_url, timeout=timeout_ms, wait_until="commit")
+        last_url[0] = page.url
+        # Meta refresh and inline redirects only fire once the document is parsed
+        try:
+            await page.wait_for_load_state("domcontentloaded", timeout=timeout_ms)
+        except Exception:
+            pass  # continue regardless; the committed URL is still valid
+
+        settle_ms = js_settle_ms
+        if settle_ms <= 0:
+            settle_ms = await meta_refresh_settle_ms(page, timeout_ms)
+
+        # Poll for JS/meta-refresh URL changes for settle_ms
+        final_url = last_url[0]
+        if settle_ms > 0:
+            remaining = settle_ms
+            step = 100
+            while remaining > 0:
+                await page.wait_for_timeout(min(step, remaining))
+                current = last_url[0]
+                if current != final_url:
+                    final_url = current
+                    # Reset small window to catch cascading redirects
+                    remaining = min(settle_ms, remaining + 2 * step)
+                remaining -= step
+    finally:
+        page.remove_listener("framenavigated", on_navigated)
+
     # Compute DOM size after settle
     dom_size_chars = 0
     try:
@@ -175,159 +475,311 @@ async def resolve_final_url(page, start_url: str, timeout_ms: int, js_settle_ms:
     return final_url, int(dom_size_chars)
 
 
-async def process_one(context, raw: str, timeout_ms: int, js_settle_ms: int) -> Tuple[str, int]:
-    """Return the final resolved URL for the given raw url/domain.
-    Tries HTTPS first, then HTTP.
+async def process_one(page, raw: str, timeout_ms: int, js_settle_ms: int) -> Tuple[str, int]:
+    """Return the final resolved URL for the given raw url/domain using page.
+    Tries HTTPS first, then HTTP only if HTTPS failed with a TLS or
+    connection-refused error.
     """
     https_url, http_url = ensure_url_scheme(raw)
-    page = await context.new_page()
     final_url = ""
     dom_size_chars = 0
     try:
         final_url, dom_size_chars = await resolve_final_url(page, https_url, timeout_ms, js_settle_ms)
-    except Exception:
-        # Try HTTP fallback if HTTPS path failed and wasn't already HTTP
-        if https_url != http_url:
+    except Exception as e:
+        message = str(getattr(e, "message", "") or e)
+        if http_url is not None and any(err in message for err in HTTP_FALLBACK_ERRORS):
             try:
                 final_url, dom_size_chars = await resolve_final_url(page, http_url, timeout_ms, js_settle_ms)
             except Exception:
                 final_url = ""
                 dom_size_chars = 0
-        else:
-            final_url = ""
-            dom_size_chars = 0
-    finally:
-        await page.close()
     return final_url, dom_size_chars
 
 
-def read_input_csv(path: Path) -> List[str]:
-    urls: List[str] = []
-    text = path.read_text(encoding="utf-8")
-    text = text.lstrip("\ufeff")  # strip BOM if present
-
-    # Try robust CSV parsing with restricted delimiters to avoid breaking on ':' in http://
-    sniffer = csv.Sniffer()
-    sample = text[:2048]
+def browser_style_url(url: str) -> str:
+    """Format url the way Chromium reports page.url: an empty path becomes '/'."""
+    parts = urlsplit(url)
+    if parts.netloc and not parts.path:
+        return urlunsplit(parts._replace(path="/"))
+    return url
+
+
+def is_http_fallback_error(exc: BaseException) -> bool:
+    """True for aiohttp errors where plain HTTP may work: TLS failures and refused connections."""
+    if isinstance(exc, aiohttp.ClientSSLError):
+        return True
+    return isinstance(exc, aiohttp.ClientConnectorError) and exc.errno == errno.ECONNREFUSED
+
+
+async def http_resolve_one(
+    session, raw: str, timeout_ms: int, verify_ssl: bool, js_enabled: bool = True
+) -> Optional[Tuple[str, Optional[int]]]:
+    """Try to resolve raw by following HTTP redirects without a browser.
+
+    Returns (final_url, None) when the answer is trustworthy: the final response
+    is not an error, has no Refresh header, and is either non-HTML or, when
+    js_enabled is False, HTML without a meta refresh. With JavaScript enabled
+    any HTML page goes to the browser without downloading the body, since
+    scripts (inline or external) may redirect. final_url is formatted like the
+    browser's page.url.
+    dom_size_chars is None because no DOM was rendered. The fast path gets its
+    own short budget (at most HTTP_FAST_PATH_TIMEOUT_MS) and a timeout hands the
+    URL to the browser, whose timeout only runs until the response commits.
+    Returns None when the browser should decide. Tries HTTPS
+    first, then HTTP after a TLS or connection-refused error, like process_one.
+    """
+    https_url, http_url = ensure_url_scheme(raw)
+    timeout = aiohttp.ClientTimeout(total=min(timeout_ms, HTTP_FAST_PATH_TIMEOUT_MS) / 1000)
+    extra = {} if verify_ssl else {"ssl": False}
+    for url in (https_url, http_url):
+        if url is None:
+            break
+        try:
+            async with session.get(url, allow_redirects=True, max_redirects=20, timeout=timeout, **extra) as resp:
+                if resp.status >= 400:
+                    return None
+                if "Refresh" in resp.headers:
+                    # Chromium follows a Refresh header just like a meta refresh
+                    return None
+                if resp.content_type not in HTML_CONTENT_TYPES and "Content-Type" in resp.headers:
+                    # Nothing to render, and no body worth downloading
+                    return browser_style_url(str(resp.url)), None
+                if js_enabled:
+                    return None
+                body = await resp.text(errors="replace")
+                if META_REFRESH_RE.search(body):
+                    return None
+                return browser_style_url(str(resp.url)), None
+        except Exception as e:
+            if is_http_fallback_error(e):
+                continue
+            # Timeouts, DNS failures, redirect loops etc.: let the browser decide
+            return None
+    return None
+
+
+async def reset_page(page):
+    """Park page on about:blank for reuse; return None if it must be replaced."""
+    if page.is_closed():
+        return None
     try:
-        dialect = sniffer.sniff(sample, delimiters=",;\t|")
+        await page.goto("about:blank")
+        return page
     except Exception:
-        dialect = csv.excel
-
-    reader = csv.reader(io.StringIO(text), dialect)
-    rows = list(reader)
-
-    # Fallback: if it looks like the first row was split into characters, treat as plain lines
-    if rows and len(rows[0]) > 1 and all(len(cell) == 1 for cell in rows[0]):
-        lines = [ln.strip() for ln in text.splitlines()]
-        lines = [ln for ln in lines if ln]
-        if lines and lines[0].strip().lower() in ("url", "domain"):
-            lines = lines[1:]
-        return lines
-
-    if not rows:
-        return urls
-
-    header_like = [c.strip().lower() for c in rows[0]]
-    start_idx = 1
-    col_idx = 0
-    if any(h in ("url", "domain") for h in header_like):
-        # Choose first matching header column
-        for i, h in enumerate(header_like):
-            if h in ("url", "domain"):
-                col_idx = i
+        try:
+            await page.close()
+        except Exception:
+            pass
+        return None
+
+
+# Sentinel each resolve_worker puts on its results queue when it stops
+WORKER_DONE = None
+
+
+async def resolve_worker(
+    jobs: Iterator[Tuple[int, str]],
+    results: asyncio.Queue,
+    context,
+    session,
+    timeout_ms: int,
+    js_settle_ms: int,
+    verify_ssl: bool,
+) -> None:
+    """Resolve (index, raw) jobs from a shared iterator until it runs dry.
+
+    When session is set, plain HTTP is tried first and the browser is only used
+    if that can't settle the URL. Each worker keeps one tab open and parks it
+    on about:blank between URLs, so the number of workers bounds how many URLs
+    are in flight and tabs are not created per URL. Every job produces exactly
+    one result, even on failure, and the worker always ends by putting
+    WORKER_DONE on results, even if it dies.
+    """
+    page = None
+    try:
+        for index, raw in jobs:
+            resolved = None
+            if session is not None:
+                resolved = await http_resolve_one(session, raw, timeout_ms, verify_ssl, js_settle_ms > 0)
+            if resolved is not None:
+                await results.put((index, raw, resolved[0], resolved[1]))
+                continue
+            try:
+                if page is None:
+                    page = await context.new_page()
+                final_url, dom_size_chars = await process_one(page, raw, timeout_ms, js_settle_ms)
+            except Exception:
+                final_url, dom_size_chars = "", 0
+            await results.put((index, raw, final_url, dom_size_chars))
+            if page is not None:
+                page = await reset_page(page)
+    finally:
+        results.put_nowait(WORKER_DONE)
+        if page is not None:
+            await page.close()
+
+
+def cdp_websocket_url(port: int, timeout_s: float = 10.0) -> str:
+    """Ask a Chromium started with --remote-debugging-port for its browser WS URL."""
+    with urllib.request.urlopen(f"http://127.0.0.1:{port}/json/version", timeout=timeout_s) as resp:
+        info = json.load(resp)
+    return info["webSocketDebuggerUrl"]
+
+
+async def serve_cdp(pw, port: int) -> None:
+    """Launch a headless Chromium exposing CDP on port and keep it alive until interrupted."""
+    browser = await pw.chromium.launch(headless=True, args=[f"--remote-debugging-port={port}"])
+    try:
+        ws_url = await asyncio.to_thread(cdp_websocket_url, port)
+        print(ws_url, flush=True)
+        print(f"Chromium is listening. Run the mapper with --cdp-endpoint {ws_url}. Press Ctrl+C to stop.", file=sys.stderr)
+        while browser.is_connected():
+            await asyncio.sleep(1)
+    finally:
+        await browser.close()
+
+
+def read_input_csv(path: Path) -> Iterator[str]:
+    """Yield URL/domain cells from the input CSV one row at a time.
+
+    The delimiter is guessed from the first non-empty line by counting the
+    usual candidates (',', ';', tab, '|'); ':' is never considered so http://
+    URLs are not split. A 'url' or 'domain' header selects the column,
+    otherwise the first column is used and the first row is data.
+    """
+    with path.open(encoding="utf-8-sig", newline="") as f:
+        first = ""
+        for line in f:
+            if line.strip():
+                first = line
                 break
-    else:
-        # No header; start from first row
-        start_idx = 0
+        if not first:
+            return
+
+        counts = {d: first.count(d) for d in ",;\t|"}
+        delimiter = max(counts, key=counts.get)
+        if not counts[delimiter]:
+            delimiter = ","
+
+        reader = csv.reader(itertools.chain([first], f), delimiter=delimiter)
+        first_row = next(reader)
+        header_like = [c.strip().lower() for c in first_row]
         col_idx = 0
+        if any(h in ("url", "domain") for h in header_like):
+            # Choose first matching header column
+            col_idx = next(i for i, h in enumerate(header_like) if h in ("url", "domain"))
+            rows: Iterator[List[str]] = reader
+        else:
+            # No header; the first row is data
+            rows = itertools.chain([first_row], reader)
 
-    for r in rows[start_idx:]:
-        if not r:
-            continue
-        cell = (r[col_idx] if col_idx < len(r) else "").strip()
-        if cell:
-            urls.append(cell)
-    return urls
+        for r in rows:
+            if not r:
+                continue
+            cell = (r[col_idx] if col_idx < len(r) else "").strip()
+            if cell:
+                yield cell
+
+
+def count_input_urls(path: Path) -> int:
+    """Count input URLs with a throwaway pass so progress has a total."""
+    return sum(1 for _ in read_input_csv(path))
+
+
+def normalize_host(host: str) -> str:
+    """Lowercase host and IDNA-encode non-ASCII labels (bücher.de -> xn--bcher-kva.de).
+
+    Every host extraction path ends here, so count keys and membership checks
+    don't depend on which parser ran or whether the input had a scheme.
+    """
+    host = host.lower()
+    if host.isascii():
+        return host
+    try:
+        return host.encode("idna").decode("ascii")
+    except UnicodeError:
+        return host
 
 
 def hostname_from_url(u: str) -> str:
+    if URL is not None and u.isascii():
+        # ASCII only, so yarl's raw_host matches normalize_host exactly;
+        # non-ASCII URLs go through urlparse and our own IDNA encoding.
+        try:
+            host = URL(u).raw_host
+            if host:
+                return host
+        except Exception:
+            pass  # e.g. invalid port; let urlparse have a go
     try:
         parsed = urlparse(u)
         if parsed.netloc:
-            return parsed.hostname or parsed.netloc
+            return normalize_host(parsed.hostname or parsed.netloc)
         # If user passed a bare domain with scheme already included oddly
-        return parsed.path
+        return normalize_host(parsed.path)
     except Exception:
         return ""
 
 
-def build_counts(
-    sources: List[str],
-    destinations: List[str],
-    dom_sizes: List[int],
-    count_by: str,
-) -> Tuple[List[Row], Dict[str, int]]:
-    """Create output rows and a map of destination-domain -> inbound count.
+def host_from_raw(raw: str) -> str:
+    """Return the normalized hostname of a raw input cell using at most one parse.
 
-    count_by: 'registrable' or 'host'
+    Bare domains (the common case) are split by hand; only inputs with a scheme,
+    userinfo or an IPv6 literal go through urlparse. Navigation still uses
+    ensure_url_scheme.
     """
-    # Normalize the input domain list for membership checks
-    input_hosts = set()
-    input_regs = set()
-    for raw in sources:
-        _, http_url = ensure_url_scheme(raw)
-        host = hostname_from_url(http_url).lower()
-        if host:
-            input_hosts.add(host)
-            input_regs.add(registrable_domain(host))
-
-    # Build inbound counts keyed by chosen granularity
-    inbound: Dict[str, int] = {}
-    dest_keys: List[str] = []
-    for dest in destinations:
-        host = hostname_from_url(dest).lower() if dest else ""
-        key = registrable_domain(host) if count_by == "registrable" else host
-        dest_keys.append(key)
-        if key:
-            inbound[key] = inbound.get(key, 0) + 1
+    raw = raw.strip()
+    if "://" not in raw:
+        host = raw
+        for sep in "/?#":
+            host = host.split(sep, 1)[0]
+        if "@" not in host and "[" not in host:
+            return normalize_host(host.split(":", 1)[0])
+        raw = "//" + raw
+    return hostname_from_url(raw)
 
-    # Build rows, including points_to_list_domain flag based on registrable match
-    rows: List[Row] = []
-    for src, dest, key, dom_size in zip(sources, destinations, dest_keys, dom_sizes):
-        dest_host = hostname_from_url(dest).lower() if dest else ""
-        dest_reg = registrable_domain(dest_host) if dest_host else ""
-        points_to_list = dest_reg in input_regs if dest_reg else False
-        count = inbound.get(key, 0) if key else 0
-        rows.append(Row(
-            source_url=src,
-            destination_url=dest,
-            pointing_to_count=count,
-            points_to_list_domain=points_to_list,
-            dom_size_chars=int(dom_size or 0),
-        ))
-    return rows, inbound
+
+def write_output_rows(spool, out_file, tally: CountTally) -> Tuple[int, int]:
+    """Second pass: join spooled results with the final counts and write them out.
+
+    spool rows are (source, destination, dom_size_chars, count key, destination
+    registrable). Returns (rows written, rows pointing to an input domain).
+    """
+    writer = csv.writer(out_file)
+    writer.writerow(OUTPUT_FIELDS)
+    # Bind lookups once; empty keys/registrables are never in either mapping
+    match_set = tally.input_regs
+    inbound_get = tally.inbound.get
+    total = 0
+    in_list = 0
+    for src, dest, dom_size, key, dest_reg in csv.reader(spool):
+        points_to_list = dest_reg in match_set
+        count = inbound_get(key, 0)
+        writer.writerow((src, dest, count, points_to_list, dom_size))
+        total += 1
+        in_list += points_to_list
+    return total, in_list
 
 
 async def main():
     parser = argparse.ArgumentParser(description="Map domains to their final destinations via a real browser.")
-    parser.add_argument("input_csv", type=Path, help="Path to input CSV with a 'url' or 'domain' column (or first column).")
+    parser.add_argument("input_csv", type=Path, nargs="?", help="Path to input CSV with a 'url' or 'domain' column (or first column).")
     parser.add_argument("-o", "--output-csv", type=Path, default=Path("redirect_map.csv"), help="Where to write the results CSV.")
     parser.add_argument("--timeout", type=int, default=15000, help="Navigation timeout per attempt, in ms. Default: 15000")
-    parser.add_argument("--js-settle", type=int, default=2000, help="Extra time to detect JS redirects, in ms. Default: 2000")
+    parser.add_argument("--js-settle", type=int, default=500, help="Extra time to detect JS redirects, in ms; 0 disables JavaScript entirely. Default: 500")
     parser.add_argument("--count-by", choices=["registrable", "host"], default="registrable", help="How to group destinations for counting. Default: registrable")
     parser.add_argument("--user-agent", type=str, default="Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/118 Safari/537.36", help="Browser User-Agent to use.")
     parser.add_argument("--ignore-https-errors", action="store_true", help="Ignore HTTPS certificate errors.")
+    parser.add_argument("--no-block-resources", action="store_true", help="Load images, fonts, media, stylesheets and analytics instead of aborting them.")
+    parser.add_argument("--cdp-endpoint", type=str, default=None, help="Attach to an already running Chromium over CDP (ws://...) instead of launching one.")
+    parser.add_argument("--launch-cdp", action="store_true", help="Launch a shared Chromium, print its CDP WS URL and keep it running for --cdp-endpoint runs.")
+    parser.add_argument("--cdp-port", type=int, default=9222, help="Remote debugging port used by --launch-cdp. Default: 9222")
+    parser.add_argument("--http-first", action="store_true", help="Try plain HTTP redirects (aiohttp) before the browser; only the browser is used by default.")
+    parser.add_argument("--concurrency", type=int, default=1, help="How many URLs to resolve at once (one tab each). Default: 1")
 
     args = parser.parse_args()
-
-    urls = read_input_csv(args.input_csv)
-    if not urls:
-        print("No URLs found in input CSV.", file=sys.stderr)
-        sys.exit(2)
-
-    total_urls = len(urls)
-    print(f"Found {total_urls} domain(s) to process.")
+    if args.concurrency < 1:
+        parser.error("--concurrency must be at least 1")
 
     try:
         from playwright.async_api import async_playwright  # type: ignore
@@ -335,66 +787,101 @@ async def main():
         print("Playwright is not installed. Run: pip install playwright && playwright install chromium", file=sys.stderr)
         sys.exit(3)
 
-    destinations: List[str] = []
-    dom_sizes: List[int] = []
+    if args.launch_cdp:
+        async with async_playwright() as pw:
+            await serve_cdp(pw, args.cdp_port)
+        return
+
+    if args.input_csv is None:
+        parser.error("input_csv is required unless --launch-cdp is given")
+    if args.http_first and aiohttp is None:
+        parser.error("--http-first needs aiohttp. Run: pip install aiohttp")
+
+    total_urls = count_input_urls(args.input_csv)
+    if not total_urls:
+        print("No URLs found in input CSV.", file=sys.stderr)
+        sys.exit(2)
+
+    print(f"Found {total_urls} domain(s) to process.")
+
+    # First pass: spool results to a temp file in input order while tallying.
+    # Concurrent tasks finish out of order, so early finishers wait in `pending`
+    # until every earlier index has been spooled.
+    tally = CountTally(args.count_by)
+    spool = tempfile.TemporaryFile("w+", buffering=CSV_BUFFER_BYTES, newline="", encoding="utf-8")
+    spool_writer = csv.writer(spool)
+    pending: Dict[int, Tuple[str, str, Optional[int]]] = {}
+    next_idx = 0
 
     async with async_playwright() as pw:
-        browser = await pw.chromium.launch(headless=True)
+        if args.cdp_endpoint:
+            # Shared browser: closing it below only disconnects and drops our context
+            browser = await pw.chromium.connect_over_cdp(args.cdp_endpoint)
+        else:
+            browser = await pw.chromium.launch(headless=True)
         context = await browser.new_context(
             user_agent=args.user_agent,
             ignore_https_errors=args.ignore_https_errors,
-            java_script_enabled=True,
+            # --js-settle 0 means no JS redirects are wanted, so skip running scripts
+            java_script_enabled=args.js_settle > 0,
         )
-        # Sequential processing
-        start_time = time.time()
-        is_tty = sys.stdout.isatty()
-        for i, raw in enumerate(urls, 1):
-            # Render progress
-            elapsed = time.time() - start_time
-            progress_line = render_progress_line(i - 1, total_urls, elapsed, f"{raw}")
-            if is_tty:
-                sys.stdout.write("\r" + progress_line)
-                sys.stdout.flush()
-            else:
-                # Non-TTY: print a clean line to avoid stray carriage returns
-                print(progress_line)
-
-            final_url, dom_size_chars = await process_one(context, raw, args.timeout, args.js_settle)
-            if not final_url:
-                final_url = ""
-            destinations.append(final_url)
-            dom_sizes.append(int(dom_size_chars or 0))
-
-            # Per-domain result line with full final URL (scheme included)
-            if is_tty:
-                sys.stdout.write("\r" + (" " * max(len(progress_line), 80)) + "\r")
-                sys.stdout.flush()
-            print(f"[{i}/{total_urls}] input: {raw} -> final: {final_url}")
-
-        # Final 100% progress update for TTY only
-        if is_tty:
-            elapsed = time.time() - start_time
-            final_line = render_progress_line(total_urls, total_urls, elapsed, "done")
-            sys.stdout.write("\r" + final_line + "\n")
-            sys.stdout.flush()
+        if not args.no_block_resources:
+            await context.route("**/*", block_unneeded_resources)
+        # args.concurrency workers pull from the lazily-read input, one tab each
+        jobs = enumerate(read_input_csv(args.input_csv))
+        results: asyncio.Queue = asyncio.Queue()
+        session = None
+        if args.http_first:
+            session = aiohttp.ClientSession(headers={"User-Agent": args.user_agent})
+        verify_ssl = not args.ignore_https_errors
+        workers = [
+            asyncio.create_task(resolve_worker(
+                jobs, results, context, session, args.timeout, args.js_settle, verify_ssl,
+            ))
+            for _ in range(args.concurrency)
+        ]
+        # Driven by worker completion; total_urls is only a progress hint
+        progress = ProgressReporter(total_urls)
+        running = len(workers)
+        try:
+            while running:
+                item = await results.get()
+                if item is WORKER_DONE:
+                    running -= 1
+                    continue
+                idx, raw, final_url, dom_size_chars = item
+                if not final_url:
+                    final_url = ""
+                # None (resolved without a browser) is written as an empty cell
+                pending[idx] = (raw, final_url, dom_size_chars)
+                while next_idx in pending:
+                    src, dest, dom_size = pending.pop(next_idx)
+                    key, dest_reg = tally.add(src, dest)
+                    spool_writer.writerow((src, dest, dom_size, key, dest_reg))
+                    next_idx += 1
+                progress.result(raw, final_url)
+        except BaseException:
+            # Interrupted or failed: the printed lines are the only record so far
+            progress.flush(final=True)
+            raise
+
+        progress.finish()
+        # Re-raises if a worker died (e.g. the input became unreadable)
+        await asyncio.gather(*workers)
+        if session is not None:
+            await session.close()
         await context.close()
         await browser.close()
 
-    rows, inbound = build_counts(urls, destinations, dom_sizes, args.count_by)
-
-    # Write CSV
+    # Second pass: stream the spool into the output CSV with final counts
     out_path: Path = args.output_csv
-    with out_path.open("w", newline="", encoding="utf-8") as f:
-        writer = csv.DictWriter(f, fieldnames=["source_url", "destination_url", "pointing_to_count", "points_to_list_domain", "dom_size_chars"])
-        writer.writeheader()
-        for r in rows:
-            writer.writerow(asdict(r))
+    with spool, out_path.open("w", buffering=CSV_BUFFER_BYTES, newline="", encoding="utf-8") as f:
+        spool.seek(0)
+        total, in_list = write_output_rows(spool, f, tally)
 
     # Summary
-    total = len(rows)
-    in_list = sum(1 for r in rows if r.points_to_list_domain)
     abs_out = out_path.resolve()
-    print(f"\nDone. Processed {total_urls} domain(s). Wrote {total} rows to {abs_out}.")
+    print(f"\nDone. Processed {progress.completed} domain(s). Wrote {total} rows to {abs_out}.")
     print(f"{in_list} source(s) point to a domain in the input list (by registrable match).")
 
 